@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+
+"""Times the conversion hot paths against fixtures built from the checked-in data.
+
+Each benchmark runs in a fresh process, so peak RSS is its own. Results are
+compared with a stored baseline (machine-specific, so git ignores it) and
+anything slower or larger than the threshold is flagged as a regression.
+--scale multiplies the fixtures by copying counties (or precincts) that
+many times.
+
+--memory instead compares the memory held by the 2020 statewide precinct
+file loaded as lists of strings and as PrecinctRecords.
+
+    python benchmark.py --save-baseline
+    python benchmark.py --scale 4 --only statewide-2020
+    python benchmark.py --memory
+"""
+
+import os
+import sys
+import csv
+import glob
+import json
+import time
+import shutil
+import tempfile
+import tracemalloc
+import multiprocessing
+import click
+
+from collections import namedtuple, defaultdict
+from contextlib import redirect_stdout
+from functools import partial
+from xml.etree import ElementTree
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(SCRIPTS_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+DEFAULT_BASELINE = os.path.join(SCRIPTS_DIR, 'benchmark_baseline.json')
+MEMORY_FIXTURE = os.path.join(ROOT_DIR, '2020', '20201103__wv__general__precinct.csv')
+
+# prepare(workdir, scale) writes fixture files in the parent process,
+# load(workdir, scale) runs untimed in the child and its result is passed to run,
+# run(loaded) is the timed call and returns a row count or an output filename.
+Benchmark = namedtuple('Benchmark', ['name', 'prepare', 'load', 'run'])
+
+
+def output_rows(fname):
+    with open(fname, 'r') as f:
+        return sum(1 for _ in f) - 1
+
+def nothing(workdir, scale):
+    return None
+
+def copy_scaled(files, target_dir, scale):
+    """Copies each file scale times, suffixing the county so every copy matches the same glob."""
+    os.makedirs(target_dir, exist_ok=True)
+    for fname in files:
+        base = os.path.basename(fname)
+        for k in range(scale):
+            shutil.copy(fname, os.path.join(target_dir, base.replace('__precinct.csv', f'{k or ""}__precinct.csv')))
+
+
+# clarity_parser.precinct_results
+
+CLARITY_SOURCE = os.path.join(ROOT_DIR, '2022', 'counties', '20221108__wv__general__kanawha__precinct.csv')
+
+def prepare_clarity(workdir, scale):
+    """Rebuilds a Clarity detail.xml from a county precinct file, repeating precincts scale times."""
+    contests = defaultdict(lambda: defaultdict(list))
+    precincts = []
+    with open(CLARITY_SOURCE, 'r') as csvfile:
+        for row in csv.DictReader(csvfile):
+            title = row['office'] + (',' + row['district'] if row['district'] else '')
+            contests[title][(row['candidate'], row['party'])].append((row['precinct'], row['votes']))
+            if row['precinct'] not in precincts:
+                precincts.append(row['precinct'])
+
+    root = ElementTree.Element('ElectionResult')
+    ElementTree.SubElement(root, 'Timestamp').text = '11/9/2022 1:00:00 AM EST'
+    ElementTree.SubElement(root, 'ElectionName').text = 'General Election'
+    ElementTree.SubElement(root, 'ElectionDate').text = '11/8/2022'
+    ElementTree.SubElement(root, 'Region').text = 'Kanawha'
+    turnout = ElementTree.SubElement(root, 'VoterTurnout', totalVoters='0', ballotsCast='0', voterTurnout='0')
+    turnout_precincts = ElementTree.SubElement(turnout, 'Precincts')
+    for k in range(scale):
+        for precinct in precincts:
+            ElementTree.SubElement(turnout_precincts, 'Precinct', name=f'{precinct}{k or ""}', totalVoters='0', ballotsCast='0', voterTurnout='0')
+    for key, (title, choices) in enumerate(contests.items()):
+        contest = ElementTree.SubElement(root, 'Contest', key=str(key), text=title, voteFor='1', isQuestion='false')
+        for choice_key, ((candidate, party), votes) in enumerate(choices.items()):
+            choice = ElementTree.SubElement(contest, 'Choice', key=str(choice_key), text=candidate, totalVotes='0')
+            if party:
+                choice.set('party', party)
+            for vote_type in ['Election Day', 'Early Voting', 'Absentee by Mail']:
+                vt = ElementTree.SubElement(choice, 'VoteType', name=vote_type, votes='0')
+                for k in range(scale):
+                    for precinct, count in votes:
+                        ElementTree.SubElement(vt, 'Precinct', name=f'{precinct}{k or ""}', votes=count if vote_type == 'Election Day' else '0')
+    ElementTree.ElementTree(root).write(os.path.join(workdir, 'detail.xml'), encoding='utf-8', xml_declaration=True)
+
+def run_clarity(loaded):
+    import clarity_parser
+    clarity_parser.precinct_results('kanawha', '20221108__wv__general')
+    return '20221108__wv__general__kanawha__precinct.csv'
+
+
+# statewide_generator.generate_consolidated_file
+
+def prepare_statewide(year, election, workdir, scale):
+    copy_scaled(glob.glob(os.path.join(ROOT_DIR, year, 'counties', election + '*precinct.csv')), os.path.join(workdir, year, 'counties'), scale)
+
+def run_statewide(year, election, loaded):
+    import statewide_generator
+    statewide_generator.generate_consolidated_file(year, election + '*precinct.csv', 'consolidated.csv')
+    return 'consolidated.csv'
+
+
+# convert_2008.parse
+
+OFFICE_2008_ALIASES = {'PRESIDENT': 'U.S. President', 'TREASURER': 'State Treasurer', 'STATE SENATOR': 'State Senate', 'MEMBER OF HOUSE OF DELEGATES': 'House of Delegates'}
+CONVERT_2008_SOURCE = os.path.join(ROOT_DIR, '2008', '20081104__wv__general__kanawha__precinct.csv')
+
+def prepare_2008(workdir, scale):
+    """Lays a 2008 county precinct file back out in the county xlsx format convert_2008 reads."""
+    from openpyxl import Workbook
+    from convert_2008 import OFFICE_TITLE_LOOKUP
+
+    titles = {k.upper(): k for k in OFFICE_TITLE_LOOKUP}
+    titles.update({v.upper(): k for k, v in OFFICE_TITLE_LOOKUP.items()})
+    titles.update(OFFICE_2008_ALIASES)
+    precincts = defaultdict(lambda: defaultdict(list))
+    with open(CONVERT_2008_SOURCE, 'r') as csvfile:
+        for row in csv.DictReader(csvfile):
+            title = titles.get(row['office'].strip().upper())
+            if title and row['votes'].isdigit():
+                party = (row['party'] or 'W')[0]
+                precincts[row['precinct']][title].append((f'{party} - {row["candidate"].replace(" - ", " ")}', int(row['votes'])))
+
+    wb = Workbook()
+    ws = wb.active
+    ws.title = 'Sheet1'
+    ws.append(['COUNTY NAME: Kanawha'])
+    for k in range(scale):
+        for precinct, offices in precincts.items():
+            ws.append([f'PRECINCT: {k}{int(precinct):04d}' if precinct.isdigit() else f'PRECINCT: {k}0000'])
+            ws.append(['TOTAL BY CONTEST'])
+            codes = {title: f'{i:04d}' for i, title in enumerate(offices, 1)}
+            for title, code in codes.items():
+                ws.append([code, title, sum(votes for _, votes in offices[title])])
+            ws.append(['TOTAL BY CANDIDATE'])
+            for title, candidates in offices.items():
+                for candidate, votes in candidates:
+                    ws.append([None, codes[title], None, candidate, None, votes])
+    wb.save(os.path.join(workdir, 'kanawha.xlsx'))
+
+def run_2008(loaded):
+    from openpyxl import load_workbook
+    import convert_2008
+    sheet_rows = [row for row in load_workbook('kanawha.xlsx').active.rows]
+    return sum(1 for _ in convert_2008.parse(sheet_rows))
+
+
+# Tickets.get_tickets
+
+def load_tickets(year, workdir, scale):
+    import pandas as pd
+    from tickets import Tickets
+    files = [f for f in glob.glob(os.path.join(ROOT_DIR, year, '*.csv')) if '__general__' in f]
+    df = pd.concat([pd.read_csv(f) for f in files] * scale)
+    return Tickets(state_name='west_virginia', df=df, year=year)
+
+def run_tickets(parser):
+    tickets, changes = parser.get_tickets(parser.df)
+    return len(parser.df)
+
+
+# convert_sos.generate_consolidated_file
+
+def prepare_sos(workdir, scale):
+    copy_scaled(glob.glob(os.path.join(ROOT_DIR, '2016', '20161108*precinct.csv')), os.path.join(workdir, '2016'), scale)
+
+def run_sos(loaded):
+    import convert_sos
+    convert_sos.generate_consolidated_file('2016', '20161108*precinct.csv', 'consolidated.csv')
+    # convert_sos leaves the working directory in the year folder
+    return 'consolidated.csv'
+
+
+BENCHMARKS = [
+    Benchmark('clarity-precinct-results', prepare_clarity, nothing, run_clarity),
+    Benchmark('statewide-2020', partial(prepare_statewide, '2020', '20201103'), nothing, partial(run_statewide, '2020', '20201103')),
+    Benchmark('statewide-2022', partial(prepare_statewide, '2022', '20221108'), nothing, partial(run_statewide, '2022', '20221108')),
+    Benchmark('convert-2008', prepare_2008, nothing, run_2008),
+    Benchmark('tickets-2018', nothing, partial(load_tickets, '2018'), run_tickets),
+    Benchmark('tickets-2020', nothing, partial(load_tickets, '2020'), run_tickets),
+    Benchmark('tickets-2022', nothing, partial(load_tickets, '2022'), run_tickets),
+    Benchmark('convert-sos-2016', prepare_sos, nothing, run_sos),
+]
+BENCHMARK_LOOKUP = {b.name: b for b in BENCHMARKS}
+
+
+def measure(name, workdir, scale):
+    """Runs a single benchmark in the current (child) process."""
+    sys.path.insert(0, SCRIPTS_DIR)
+    from instrument import peak_rss_mb
+    os.chdir(workdir)
+    bench = BENCHMARK_LOOKUP[name]
+    loaded = bench.load(workdir, scale)
+    # the scripts print every file they touch
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        started = time.perf_counter()
+        rows = bench.run(loaded)
+        wall = time.perf_counter() - started
+    if isinstance(rows, str):
+        rows = output_rows(rows)
+    return {
+        'wall_time': wall,
+        'peak_rss_mb': peak_rss_mb(),
+        'rows': rows,
+        'rows_per_sec': rows / wall if wall else 0,
+    }
+
+def run_benchmark(bench, scale, repeat):
+    """Prepares fixtures and runs the benchmark repeat times, keeping the fastest run."""
+    runs = []
+    with tempfile.TemporaryDirectory() as workdir:
+        try:
+            bench.prepare(workdir, scale)
+        except ImportError as e:
+            return {'skipped': str(e)}
+        ctx = multiprocessing.get_context('spawn')
+        for i in range(repeat):
+            with ctx.Pool(1) as pool:
+                try:
+                    runs.append(pool.apply(measure, (bench.name, workdir, scale)))
+                except ImportError as e:
+                    return {'skipped': str(e)}
+                except Exception as e:
+                    return {'error': f'{type(e).__name__}: {e}'}
+    best = min(runs, key=lambda r: r['wall_time'])
+    best['peak_rss_mb'] = max(r['peak_rss_mb'] for r in runs)
+    return best
+
+def compare(results, baseline, threshold):
+    """Returns (name, metric, baseline value, new value) for each regression beyond threshold."""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base or 'wall_time' not in result or 'wall_time' not in base:
+            continue
+        for metric in ['wall_time', 'peak_rss_mb']:
+            if result[metric] > base[metric] * (1 + threshold):
+                regressions.append((name, metric, base[metric], result[metric]))
+    return regressions
+
+
+def traced_memory(load):
+    """Bytes still allocated by load() once it returns, and its result."""
+    tracemalloc.start()
+    rows = load()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current, rows
+
+def memory_comparison(fname):
+    from records import record_from_row
+
+    def load_lists():
+        with open(fname, 'r') as csvfile:
+            return [[row['county'], row['precinct'], row['office'], row['district'], row['candidate'], row['party'], row['votes']] for row in csv.DictReader(csvfile)]
+
+    def load_records():
+        with open(fname, 'r') as csvfile:
+            return [record_from_row(row) for row in csv.DictReader(csvfile)]
+
+    list_bytes, rows = traced_memory(load_lists)
+    record_bytes, _ = traced_memory(load_records)
+    click.echo(f'{fname}: {len(rows)} rows')
+    click.echo(f'lists of strings: {list_bytes / 2**20:.1f} MiB')
+    click.echo(f'PrecinctRecords:  {record_bytes / 2**20:.1f} MiB ({1 - record_bytes / list_bytes:.0%} smaller)')
+
+
+@click.command()
+@click.option('--only', multiple=True, type=click.Choice([b.name for b in BENCHMARKS]), help='Run only these benchmarks')
+@click.option('--scale', default=1, help='Multiply fixtures by this many copies')
+@click.option('--repeat', default=3, help='Runs per benchmark; the fastest is kept')
+@click.option('--baseline', default=DEFAULT_BASELINE, type=click.Path(), help='Baseline json file')
+@click.option('--save-baseline', is_flag=True, help='Write these results as the new baseline')
+@click.option('--threshold', default=0.2, help='Allowed slowdown or growth before flagging, as a fraction')
+@click.option('--memory', is_flag=True, help='Compare the memory of the 2020 precinct file as lists and as records instead')
+def benchmark(only, scale, repeat, baseline, save_baseline, threshold, memory):
+    """Runs the conversion benchmarks and flags regressions against a stored baseline."""
+    if memory:
+        memory_comparison(MEMORY_FIXTURE)
+        return
+    key = lambda name: f'{name}@x{scale}'
+    results = {}
+    for bench in BENCHMARKS:
+        if only and bench.name not in only:
+            continue
+        click.echo(f'{bench.name} (x{scale})...')
+        result = run_benchmark(bench, scale, repeat)
+        results[key(bench.name)] = result
+        if 'wall_time' in result:
+            click.echo(f'  {result["wall_time"]:.3f}s  {result["peak_rss_mb"]:.1f} MB peak  {result["rows"]} rows  {result["rows_per_sec"]:.0f} rows/s')
+        else:
+            click.echo(f'  {result}')
+
+    stored = {}
+    if os.path.exists(baseline):
+        with open(baseline, 'r') as f:
+            stored = json.load(f)
+
+    regressions = compare(results, stored, threshold)
+    for name, metric, before, after in regressions:
+        click.echo(f'REGRESSION {name} {metric}: {before:.3f} -> {after:.3f} ({after / before - 1:+.0%})')
+    # a benchmark that crashes is a failure, not a pass with nothing to compare
+    errors = [(name, result['error']) for name, result in results.items() if 'error' in result]
+    for name, error in errors:
+        click.echo(f'ERROR {name}{" (in baseline)" if name in stored else ""}: {error}')
+
+    if save_baseline:
+        stored.update({k: v for k, v in results.items() if 'wall_time' in v})
+        with open(baseline, 'w') as f:
+            json.dump(stored, f, indent=2, sort_keys=True)
+        click.echo(f'Saved baseline to {baseline}')
+    if errors or (regressions and not save_baseline):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+
+"""Checks parse_office and parse_party against contest_titles.csv.
+
+contest_titles.csv holds the contest titles of the 2018 and 2020 primaries
+and the 2020 and 2022 generals, rebuilt from the office and district columns
+of the county precinct files that detail.xml produced, with the
+(office, district, party) the original split-based rules gave for each.
+An empty district or party stands for None.
+
+    python check_contest_titles.py
+"""
+
+import os
+import csv
+
+from clarity_parser import parse_office, parse_party
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'contest_titles.csv')
+
+
+def check_titles(fname=CORPUS):
+    '''Returns the titles whose parse differs from the corpus, with what was expected and what was parsed.'''
+    mismatches = []
+    with open(fname, 'r') as csvfile:
+        for row in csv.DictReader(csvfile):
+            expected = (row['office'], row['district'] or None, row['party'] or None)
+            parsed = parse_office(row['title']) + (parse_party(row['title']),)
+            if parsed != expected:
+                mismatches.append((row['title'], expected, parsed))
+    return mismatches
+
+
+if __name__ == '__main__':
+    mismatches = check_titles()
+    for title, expected, parsed in mismatches:
+        print(f'{title!r}: expected {expected}, parsed {parsed}')
+    assert not mismatches, f'{len(mismatches)} titles parsed differently'
+    print('ok')
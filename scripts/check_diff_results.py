@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+"""Checks diff_results.py against a perturbed copy of the 2022 general precinct file.
+
+Votes are changed, rows removed and added, and some keys repeated in the old
+file, the new one or both. The hashed diff and the merge diff of sorted copies
+must both report exactly the changes that were made, with the right deltas,
+and --sorted on unsorted input must fail without leaving a changes file.
+
+    python check_diff_results.py
+"""
+
+import os
+import io
+import csv
+import tempfile
+import click
+
+from collections import Counter
+
+from diff_results import KEY_FIELDS, diff, diff_files
+from records import to_votes
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FILE_2022 = os.path.join(ROOT_DIR, '2022', '20221108__wv__general__precinct.csv')
+
+
+def row_key(row):
+    return tuple(row[f] or '' for f in KEY_FIELDS)
+
+def expected_change(kind, row, old_votes, new_votes):
+    delta = new_votes - old_votes if kind == 'changed' else ''
+    return tuple(str(v) for v in (kind,) + row_key(row) + (old_votes, new_votes, delta))
+
+def perturb(rows):
+    '''
+    Returns old rows, new rows and the changes between them. Each row picks
+    one edit by position, so the edits never overlap.
+    '''
+    old, new, expected = [], [], Counter()
+    for i, row in enumerate(rows):
+        votes = to_votes(row['votes'])
+        edit = i % 53 if isinstance(votes, int) else None
+        old.append(row)
+        if edit == 0:
+            new.append(dict(row, votes=str(votes + i % 7 + 1)))
+            expected[expected_change('changed', row, votes, votes + i % 7 + 1)] += 1
+        elif edit == 1:
+            expected[expected_change('removed', row, votes, '')] += 1
+        elif edit == 2:
+            # repeated in the old file only, so one copy is removed
+            old.append(row)
+            new.append(row)
+            expected[expected_change('removed', row, votes, '')] += 1
+        elif edit == 3:
+            # repeated in the new file only
+            new.append(row)
+            new.append(dict(row, votes=str(votes + 5)))
+            expected[expected_change('added', row, '', votes + 5)] += 1
+        elif edit == 4:
+            # repeated in both and paired in file order, so only the second copy changed
+            old.append(row)
+            new.append(row)
+            new.append(dict(row, votes=str(votes + 3)))
+            expected[expected_change('changed', row, votes, votes + 3)] += 1
+        elif edit == 5:
+            added = dict(row, candidate=row['candidate'] + ' (WRITE-IN)')
+            new.append(row)
+            new.append(added)
+            expected[expected_change('added', added, '', votes)] += 1
+        else:
+            new.append(row)
+    return old, new, expected
+
+def write_rows(fname, fieldnames, rows):
+    with open(fname, 'w') as csvfile:
+        w = csv.DictWriter(csvfile, fieldnames=fieldnames)
+        w.writeheader()
+        w.writerows(rows)
+
+def run_diff(old_file, new_file, **kwargs):
+    '''Returns the diff's counts and its change rows as a multiset.'''
+    output = io.StringIO()
+    counts = diff_files(old_file, new_file, output, **kwargs)
+    output.seek(0)
+    reader = csv.reader(output)
+    assert next(reader) == ['change'] + KEY_FIELDS + ['old_votes', 'new_votes', 'delta']
+    return counts, Counter(tuple(r) for r in reader)
+
+def check_diffs(directory):
+    with open(FILE_2022, 'r') as csvfile:
+        reader = csv.DictReader(csvfile)
+        fieldnames = reader.fieldnames
+        rows = list(reader)
+    old, new, expected = perturb(rows)
+    kinds = Counter(change[0] for change in expected.elements())
+    assert all(kinds[k] for k in ('added', 'removed', 'changed')), kinds
+
+    files = {}
+    for name, version in (('old', old), ('new', new)):
+        files[name] = os.path.join(directory, f'{name}.csv')
+        write_rows(files[name], fieldnames, version)
+        # a stable sort keeps repeated keys in file order, so they pair up as in the hashed diff
+        files[name + '_sorted'] = os.path.join(directory, f'{name}_sorted.csv')
+        write_rows(files[name + '_sorted'], fieldnames, sorted(version, key=row_key))
+
+    for partitions in (1, 16):
+        counts, changes = run_diff(files['old'], files['new'], partitions=partitions)
+        assert changes == expected, (changes - expected, expected - changes)
+        assert counts == kinds, counts
+
+    counts, changes = run_diff(files['old_sorted'], files['new_sorted'], presorted=True)
+    assert changes == expected, (changes - expected, expected - changes)
+    assert counts == kinds, counts
+
+    counts, changes = run_diff(files['old'], files['old'])
+    assert not changes and not any(counts.values()), counts
+
+    # unsorted input to --sorted fails partway through, and must not leave a partial changes file
+    output = os.path.join(directory, 'changes.csv')
+    try:
+        diff.main([files['old'], files['new'], '--sorted', '-o', output], standalone_mode=False)
+    except click.ClickException as e:
+        assert 'not sorted' in e.message, e.message
+    else:
+        raise AssertionError('--sorted accepted unsorted input')
+    assert not os.path.exists(output)
+    assert sorted(os.listdir(directory)) == sorted(os.path.basename(f) for f in files.values()), os.listdir(directory)
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as directory:
+        check_diffs(directory)
+    print('ok')
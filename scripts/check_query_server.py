@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+"""Checks the query server's county and state rollups against the precinct rows.
+
+The 2018 general file carries county subtotal rows (Raleigh,TOTAL and the like)
+next to the precincts they sum, which must not be counted a second time.
+
+    python check_query_server.py
+"""
+
+import os
+import csv
+
+from collections import defaultdict
+
+from query_server import ROOT_DIR, SUBTOTAL_PRECINCTS, ElectionIndex, normalize
+from records import to_votes
+
+FILE_2018 = os.path.join(ROOT_DIR, '2018', '20181106__wv__general__precinct.csv')
+
+
+def precinct_sums(fname):
+    '''
+    Sums the real precinct rows of a file per (county, office, district, candidate, party),
+    skipping subtotals.
+    '''
+    sums = defaultdict(int)
+    with open(fname, 'r') as csvfile:
+        for row in csv.DictReader(csvfile):
+            votes = to_votes(row['votes'])
+            if not isinstance(votes, int) or normalize(row['precinct']) in SUBTOTAL_PRECINCTS:
+                continue
+            sums[(normalize(row['county']), normalize(row['office']), normalize(row['district']), row['candidate'], row['party'])] += votes
+    return sums
+
+def check_raleigh(index):
+    expected = sum(r['votes'] for r in index.query('precinct', office='U.S. Senate', county='Raleigh', candidate='Patrick Morrisey')
+                   if normalize(r['precinct']) not in SUBTOTAL_PRECINCTS)
+    [total] = index.query('county', office='U.S. Senate', county='Raleigh', candidate='Patrick Morrisey')
+    assert expected == 12620, expected
+    assert total['votes'] == expected, f"Raleigh U.S. Senate Morrisey: county total {total['votes']}, precincts {expected}"
+
+def check_counties(index, sums):
+    totals = {(normalize(r['county']), normalize(r['office']), normalize(r['district']), r['candidate'], r['party']): r['votes']
+              for r in index.query('county')}
+    assert totals == dict(sums), 'county rollups differ from the precinct sums'
+
+def check_state(index, sums):
+    expected = defaultdict(int)
+    for (county, office, district, candidate, party), votes in sums.items():
+        expected[(office, district, candidate, party)] += votes
+    totals = {(normalize(r['office']), normalize(r['district']), r['candidate'], r['party']): r['votes'] for r in index.query('state')}
+    assert totals == dict(expected), 'state rollups differ from the precinct sums'
+
+
+if __name__ == '__main__':
+    index = ElectionIndex('20181106__wv__general', FILE_2018)
+    sums = precinct_sums(FILE_2018)
+    check_raleigh(index)
+    check_counties(index, sums)
+    check_state(index, sums)
+    print('ok')
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+"""Runs the Clarity watcher end to end against mock_clarity.py.
+
+Polls once, polls again with nothing published, then bumps one county and
+checks that only that county is refreshed and the statewide file follows.
+Then checks that a county bumped while the county listing fails is picked
+up on the next poll, and that an unreachable host fails the poll without
+stopping the watcher. Output goes to a temporary year folder.
+
+    python check_watch_clarity.py
+"""
+
+import os
+import csv
+import socket
+import tempfile
+
+from mock_clarity import MockElection, start_server
+from watch_clarity import ClarityWatcher
+
+FILENAME = '20221108__wv__general'
+
+
+def read_votes(fname):
+    with open(fname, 'r') as csvfile:
+        return {(r['county'], r['precinct'], r['office'], r['district'], r['candidate']): r['votes'] for r in csv.DictReader(csvfile)}
+
+def check_watcher(year_dir):
+    counties_dir = os.path.join(year_dir, 'counties')
+    os.makedirs(counties_dir)
+    election = MockElection()
+    server, url = start_server(election)
+    try:
+        watcher = ClarityWatcher(url, FILENAME, year_dir, interval=0)
+
+        metrics = watcher.run_cycle()
+        assert sorted(metrics['refreshed']) == sorted(election.versions), metrics
+        assert not metrics['failed'], metrics
+        statewide = os.path.join(year_dir, FILENAME + '__precinct.csv')
+        before = read_votes(statewide)
+        assert {county for county, *_ in before} == set(election.versions), before
+
+        metrics = watcher.run_cycle()
+        assert metrics['refreshed'] == [], metrics
+
+        county = election.bump('Kanawha')
+        metrics = watcher.run_cycle()
+        assert metrics['refreshed'] == [county], metrics
+        after = read_votes(statewide)
+        assert before.keys() == after.keys()
+        changed = {k[0] for k in before if before[k] != after[k]}
+        assert changed == {county}, changed
+
+        # a failed county listing must not be taken as nothing having changed
+        election.bump('Boone')
+        election.fail('electionsettings.json')
+        metrics = watcher.run_cycle()
+        assert metrics['poll_failed'] and metrics['refreshed'] == [], metrics
+        metrics = watcher.run_cycle()
+        assert not metrics['poll_failed'] and metrics['refreshed'] == ['Boone'], metrics
+
+        assert sorted(os.listdir(counties_dir)) == sorted(f'{FILENAME}__{c.lower()}__precinct.csv' for c in election.versions), os.listdir(counties_dir)
+    finally:
+        server.shutdown()
+
+def check_unreachable(year_dir):
+    '''A host that refuses connections is a failed poll, not the end of the watch.'''
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    url = f'http://127.0.0.1:{port}/results.enr.clarityelections.com/WV/115888/Web01/en/summary.html'
+    watcher = ClarityWatcher(url, FILENAME, year_dir, interval=0)
+    metrics = watcher.run_cycle()
+    assert metrics['poll_failed'] and metrics['poll_error'] and metrics['refreshed'] == [], metrics
+    assert watcher.state_version is None
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as year_dir:
+        check_watcher(year_dir)
+        check_unreachable(year_dir)
+    print('ok')
@@ -2,12 +2,21 @@ import clarify
 import requests
 import zipfile
 import csv
+import re
+
+from functools import lru_cache
+
+from instrument import trace
+from records import PrecinctRecord, PRECINCT_FIELDS, intern_value, row_getter
 
 try:
     from StringIO import StringIO
 except ImportError:
     from io import StringIO, BytesIO
 
+# seconds to wait on the results host before giving up on a report
+REQUEST_TIMEOUT = 60
+
 def statewide_results(url):
     j = clarify.Jurisdiction(url=url, level="state")
     r = requests.get("https://results.enr.clarityelections.com//WV//106210/272340/reports/detailxml.zip", stream=True)
@@ -50,96 +59,195 @@ def statewide_results(url):
             total_votes = row['Election Day']# + row['Absentee by Mail'] + row['Advance in Person'] + row['Provisional']
             w.writerow([row['county'], row['office'], row['district'], row['party'], row['candidate'], total_votes])
 
-def download_county_files(url, filename):
+def download_county_files(url, filename, vote_type_columns=False):
     no_xml = []
     j = clarify.Jurisdiction(url=url, level="state")
     subs = j.get_subjurisdictions()
     for sub in subs:
         try:
-            r = requests.get(sub.report_url('xml'), stream=True, headers={"User-Agent": "Mozilla/5.0 (platform; rv:geckoversion) Gecko/geckotrail Firefox/firefoxversion"})
-            z = zipfile.ZipFile(BytesIO(r.content))
-            z.extractall()
-            precinct_results(sub.name.replace(' ','_').lower(),filename)
+            fetch_county_report(sub)
+            precinct_results(county_file_name(sub),filename,vote_type_columns)
         except:
             no_xml.append(sub.name)
 
     print(no_xml)
 
-def precinct_results(county_name, filename):
-    f = filename + '__' + county_name + '__precinct.csv'
-    p = clarify.Parser()
-    p.parse("detail.xml")
-    results = []
+def county_file_name(sub):
+    return sub.name.replace(' ','_').lower()
+
+def fetch_county_report(sub, directory=None):
+    """Downloads a county's detail.xml report and extracts it into directory, the current one by default."""
+    with trace.stage('download', county=sub.name):
+        r = requests.get(sub.report_url('xml'), stream=True, headers={"User-Agent": "Mozilla/5.0 (platform; rv:geckoversion) Gecko/geckotrail Firefox/firefoxversion"}, timeout=REQUEST_TIMEOUT)
+        content = r.content
+    with trace.stage('unzip', county=sub.name):
+        z = zipfile.ZipFile(BytesIO(content))
+        z.extractall(directory)
+
+def precinct_results(county_name, filename, vote_type_columns=False):
+    results, vote_types = parse_precinct_results()
+    write_precinct_results(county_name, filename, results, vote_types, vote_type_columns)
+
+def parse_precinct_results(xml_file="detail.xml"):
+    """
+    Returns a generator of PrecinctRecords, one contest at a time, and the vote types
+    their breakdowns are aligned with. Rows are only built as the generator is consumed,
+    except while tracing, when they are built up front in their own stage.
+    """
+    with trace.stage('parse', file=xml_file):
+        p = clarify.Parser()
+        p.parse(xml_file)
+        vote_types = contest_vote_types(p.contests)
+    print(vote_types)
+    records = precinct_records(p, vote_types)
+    if trace.enabled:
+        # otherwise grouping results into records would be timed as part of the write
+        with trace.stage('build', file=xml_file):
+            records = list(trace.counted(records, 'records'))
+    return records, vote_types
+
+def contest_vote_types(contests):
+    """Collects vote types from the first choice of each contest, in the order they appear."""
     vote_types = []
-    for result in [x for x in p.results if not 'Number of Precincts' in x.vote_type]:
-        vote_types.append(result.vote_type)
-        if result.choice is None:
+    for contest in contests:
+        if not contest.choices:
             continue
-        candidate = result.choice.text
-        office, district = parse_office(result.contest.text)
-        party = result.choice.party #parse_party(result.contest.text)
-#        if '(' in candidate and party is None:
-#            if '(I)' in candidate:
-#                if '(I)(I)' in candidate:
-#                    candidate = candidate.split('(I)')[0]
-#                    party = 'I'
+        for result in contest.choices[0].results:
+            if result.jurisdiction is None and not result.vote_type in vote_types:
+                vote_types.append(result.vote_type)
+    return [k for k in vote_types if k != 'regVotersCounty' and not 'Number of Precincts' in k]
+#    return [k for k in vote_types if k not in ('regVotersCounty', 'underVotes') and not 'Number of Precincts' in k]
+
+def precinct_records(p, vote_types):
+    county = intern_value(p.region)
+    vote_type_index = {k: i for i, k in enumerate(vote_types)}
+    contests = contest_table(p.contests)
+    for contest in p.contests:
+        office, district, office_party = contests[contest.text]
+        # votes per (precinct, party, candidate), indexed like vote_types
+        results = {}
+        for result in contest.results:
+            i = vote_type_index.get(result.vote_type)
+            if i is None or result.choice is None:
+                continue
+            candidate = result.choice.text
+            party = result.choice.party #parse_party(result.contest.text)
+#            if '(' in candidate and party is None:
+#                if '(I)' in candidate:
+#                    if '(I)(I)' in candidate:
+#                        candidate = candidate.split('(I)')[0]
+#                        party = 'I'
+#                    else:
+#                        candidate, party = candidate.split('(I)')
 #                else:
-#                    candidate, party = candidate.split('(I)')
-#            else:
-#                candidate, party = candidate.split('(', 1)
-#                candidate = candidate.strip()
-#            party = party.replace(')','').strip()
-        county = p.region
-        if result.jurisdiction:
-            precinct = result.jurisdiction.name
-        else:
-            precinct = None
-        if precinct == None:
-            continue
-        r = [x for x in results if x['county'] == county and x['precinct'] == precinct and x['office'] == office and x['district'] == district and x['party'] == party and x['candidate'] == candidate]
-        if r:
-             r[0][result.vote_type] = result.votes
-        else:
-            results.append({ 'county': county, 'precinct': precinct, 'office': office, 'district': district, 'party': party, 'candidate': candidate, result.vote_type: result.votes})
+#                    candidate, party = candidate.split('(', 1)
+#                    candidate = candidate.strip()
+#                party = party.replace(')','').strip()
+            if result.jurisdiction:
+                precinct = result.jurisdiction.name
+            else:
+                precinct = None
+            if precinct == None:
+                continue
+            key = (intern_value(precinct), intern_value(party), intern_value(candidate))
+            votes = results.get(key)
+            if votes is None:
+                votes = results[key] = [None] * len(vote_types)
+            votes[i] = result.votes
 
-    vote_types = list(set(vote_types))
-    print(vote_types)
-    vote_types.remove('regVotersCounty')
-#    vote_types.remove('underVotes')
-    with open(f, "wt") as csvfile:
+        for (precinct, party, candidate), votes in results.items():
+            if office_party:
+                party = office_party
+            total_votes = sum([v for v in votes if v])
+            yield PrecinctRecord(county, precinct, office, district, party, candidate, total_votes, tuple(votes))
+
+def write_precinct_results(county_name, filename, results, vote_types, vote_type_columns=False):
+    f = filename + '__' + county_name + '__precinct.csv'
+    row = row_getter()
+    # rows are built from the parsed contests as they are written, unless tracing built them already
+    results = trace.counted(results)
+    with trace.stage('write', file=f), open(f, "wt") as csvfile:
         w = csv.writer(csvfile)
-        headers = ['county', 'precinct', 'office', 'district', 'party', 'candidate', 'votes'] #+ [x.replace(' ','_').lower() for x in vote_types]
-        w.writerow(headers)
-        for row in results:
-            if 'Republican' in row['office']:
-                row['party'] = 'REP'
-            elif 'Democrat' in row['office']:
-                row['party'] = 'DEM'
-            total_votes = sum([row[k] for k in vote_types if row[k]])
-            w.writerow([row['county'], row['precinct'], row['office'], row['district'], row['party'], row['candidate'], total_votes])# + [row[k] for k in vote_types])
+        if vote_type_columns:
+            w.writerow(PRECINCT_FIELDS + [x.lower() for x in vote_types])
+            w.writerows(row(r) + r.breakdown for r in results)
+        else:
+            w.writerow(PRECINCT_FIELDS)
+            w.writerows(map(row, results))
+
 
+# Contest titles read "OFFICE[, DISTRICT][ - PARTY]", for example
+# "HOUSE OF DELEGATES, 10th District - DEM" or "State Senator, District 12 - REP".
+# The grammar reproduces the original split-based rules exactly, including
+# cutting the office at its first hyphen when a " - " suffix is present.
+PARTY_SUFFIX = ' - '
+OFFICE_BEFORE_HYPHEN_REGEX = re.compile(r'[^-]*')
+OFFICE_BEFORE_COMMA_REGEX = re.compile(r'[^,]*')
+DISTRICT_REGEX = re.compile(r', District((?:(?! - |, District).)*)', re.S)
+COMMA_DISTRICT_REGEX = re.compile(r',([^,]*)')
+PARTY_REGEX = re.compile(r'.*?- (REP)|.*?- (DEM)', re.S)
 
+# a county file has tens of thousands of results but only a few dozen titles
+@lru_cache(maxsize=1024)
 def parse_office(office_text):
-    if ' - ' in office_text:
-        office = office_text.split('-')[0]
+    """
+    Splits a contest title into office and district. Real titles are checked
+    by check_contest_titles.py; these cover rules the corpus doesn't reach.
+
+    >>> parse_office('U.S. HOUSE OF REPRESENTATIVES, 2nd Congressional District')
+    ('U.S. HOUSE OF REPRESENTATIVES', ' 2nd Congressional District')
+    >>> parse_office('STATE SENATOR, District 12 - REP')
+    ('STATE SENATOR, District 12', '12')
+    >>> parse_office('United States Senator, Unexpired Term - DEM')
+    ('United States Senator', None)
+    >>> parse_office('NON-PARTISAN BALLOT OF ELECTION OF CIRCUIT COURT JUDGE, 10th Judicial Circuit - 1st Division')
+    ('NON', ' 10th Judicial Circuit - 1st Division')
+    >>> parse_office('PARKS, TRAILS, AND RECREATION LEVY')
+    ('PARKS', ' TRAILS')
+    >>> parse_office('BOARD OF EDUCATION, District 3, Division 2 - DEM')
+    ('BOARD OF EDUCATION, District 3, Division 2', '3, Division 2')
+    """
+    if PARTY_SUFFIX in office_text:
+        office = OFFICE_BEFORE_HYPHEN_REGEX.match(office_text).group()
     else:
-        office = office_text.split(',')[0]
-    if ', District' in office_text:
-        district = office_text.split(', District')[1].split(' - ')[0].strip()
+        office = OFFICE_BEFORE_COMMA_REGEX.match(office_text).group()
+    district = DISTRICT_REGEX.search(office_text)
+    if district:
+        district = district.group(1).strip()
     elif 'United States Senator' in office_text:
         office = 'United States Senator'
-        district = None
-    elif ',' in office_text:
-        district = office_text.split(',')[1]
     else:
-        district = None
-    return [office.strip(), district]
+        district = COMMA_DISTRICT_REGEX.search(office_text)
+        if district:
+            district = district.group(1)
+    return (office.strip(), district)
 
+@lru_cache(maxsize=1024)
 def parse_party(office_text):
-    if '- REP' in office_text:
-        party = 'REP'
-    elif '- DEM' in office_text:
-        party = 'DEM'
-    else:
-        party = None
-    return party
+    """
+    >>> parse_party('HOUSE OF DELEGATES, 10th District - DEM')
+    'DEM'
+    """
+    party = PARTY_REGEX.match(office_text)
+    if party:
+        return party.group(1) or party.group(2)
+    return None
+
+def contest_table(contests):
+    """
+    Parses each contest title once, mapping it to (office, district, party).
+    party is only set when the office names it, and then overrides the choice's party.
+    """
+    table = {}
+    for contest in contests:
+        if contest.text in table:
+            continue
+        office, district = parse_office(contest.text)
+        if 'Republican' in office:
+            party = 'REP'
+        elif 'Democrat' in office:
+            party = 'DEM'
+        else:
+            party = None
+        table[contest.text] = (intern_value(office), intern_value(district), party)
+    return table
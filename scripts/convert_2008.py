@@ -13,6 +13,8 @@ from openpyxl import load_workbook
 
 from zipfile import BadZipfile
 
+from records import PRECINCT_FIELDS, make_record, row_getter
+
 PrecinctRows = namedtuple('PrecinctRows', ['precinct', 'start', 'end'])
 OfficeRegex = namedtuple('OfficeRegex', ['office', 'office_code', 'regex'])
 
@@ -136,22 +138,14 @@ def parse(sheet_rows):
 def rollup(converted_rows):
     """Takes parsed rows, computes the total for each candidate cast across all precincts, and adds totals to results"""
     totals = []
-    converted_rows.sort(key=lambda x: x['candidate'])
+    converted_rows.sort(key=lambda x: x.candidate)
 
-    for key, group in groupby(converted_rows, key=lambda x: x['candidate']):
+    for key, group in groupby(converted_rows, key=lambda x: x.candidate):
         group_rows = [row for row in group]
-        total = sum([row['votes'] for row in group_rows])
-        total_row = {}
-        for k,v in group_rows[0].items():
-            if k == 'precinct':
-                total_row[k] = 'Total'
-            elif k == 'votes':
-                total_row[k] = total
-            else:
-                total_row[k] = v
-        totals.append(total_row)
+        total = sum([row.votes for row in group_rows])
+        totals.append(group_rows[0]._replace(precinct='Total', votes=total))
     combined = totals + converted_rows
-    combined.sort(key=lambda x: x['office'])
+    combined.sort(key=lambda x: x.office)
     return combined
 
 def convert_sheet(input_file, output_dir):
@@ -173,21 +167,13 @@ def convert_sheet(input_file, output_dir):
     click.echo(f'Processing {county}...')
     converted = []
     for precinct, office, party, candidate, votes in parse(sheet_rows):
-        converted.append({
-            'county': county,
-            'precinct': precinct,
-            'office': OFFICE_TITLE_LOOKUP[office],
-            'district': lookup_district(office, county),
-            'party': party,
-            'candidate': candidate,
-            'votes': votes
-        })
+        converted.append(make_record(county, precinct, OFFICE_TITLE_LOOKUP[office], lookup_district(office, county), party, candidate, votes))
     converted_with_totals = rollup(converted)
     click.echo(f'Saving {county} results to {output_filepath}...\n')
     with open(output_filepath, 'w') as f:
-        writer = csv.DictWriter(f, fieldnames=['county', 'precinct', 'office', 'district', 'party', 'candidate', 'votes'])
-        writer.writeheader()
-        writer.writerows(converted_with_totals)
+        writer = csv.writer(f)
+        writer.writerow(PRECINCT_FIELDS)
+        writer.writerows(map(row_getter(), converted_with_totals))
 
 
 @click.command()
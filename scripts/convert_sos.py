@@ -4,6 +4,10 @@ import os
 import glob
 import csv
 
+from records import record_from_row, row_getter
+
+OUTPUT_FIELDS = ['county','precinct', 'office', 'district', 'candidate', 'party', 'votes']
+
 year = '2016'
 election = '20161108'
 path = election+'*precinct.csv'
@@ -44,12 +48,12 @@ def generate_openelex_file(year, path, output_file):
             reader = csv.DictReader(csvfile)
             for row in reader:
                 if row['office'].strip() in ['President', 'Governor', 'Lieutenant Governor', 'Secretary of State', 'State Auditor', 'State Treasurer', 'Commissioner of Agriculture & Commerce', 'Commissioner of Insurance', 'Attorney General', 'U.S. House', 'State Senate', 'State House', 'U.S. Senate']:
-                    results.append([row['county'], row['precinct'], row['office'], row['district'], row['candidate'], row['party'], row['votes']])
+                    results.append(record_from_row(row))
 
             with open(output_file, "w") as csv_outfile:
                 outfile = csv.writer(csv_outfile)
-                outfile.writerow(['county','precinct', 'office', 'district', 'candidate', 'party', 'votes'])
-                outfile.writerows(results)
+                outfile.writerow(OUTPUT_FIELDS)
+                outfile.writerows(map(row_getter(OUTPUT_FIELDS), results))
 
 
 def generate_consolidated_file(year, path, output_file):
@@ -61,9 +65,9 @@ def generate_consolidated_file(year, path, output_file):
             reader = csv.DictReader(csvfile)
             for row in reader:
                 if row['office'].strip() in ['President', 'Governor', 'Lieutenant Governor', 'Secretary of State', 'State Auditor', 'State Treasurer', 'Commissioner of Agriculture & Commerce', 'Commissioner of Insurance', 'Attorney General', 'U.S. House', 'State Senate', 'State House', 'U.S. Senate']:
-                    results.append([row['county'], row['precinct'], row['office'], row['district'], row['candidate'], row['party'], row['votes']])
+                    results.append(record_from_row(row))
 
     with open(output_file, "w") as csv_outfile:
         outfile = csv.writer(csv_outfile)
-        outfile.writerow(['county','precinct', 'office', 'district', 'candidate', 'party', 'votes'])
-        outfile.writerows(results)
+        outfile.writerow(OUTPUT_FIELDS)
+        outfile.writerows(map(row_getter(OUTPUT_FIELDS), results))
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+
+"""Keyed diff between two snapshots of a precinct or county results file.
+
+Rows are matched on (county, precinct, office, district, party, candidate),
+leaving out precinct for county files, and written out as added, removed or
+changed with the vote delta. Unchanged rows are skipped.
+
+By default both files are hash-partitioned into temporary files so only one
+partition of the old snapshot is held in memory at a time. Inputs already
+sorted by key can be merged directly with --sorted.
+
+    python diff_results.py old/20221108__wv__general__precinct.csv 20221108__wv__general__precinct.csv -o changes.csv
+"""
+
+import os
+import sys
+import csv
+import zlib
+import tempfile
+import click
+
+from collections import defaultdict, deque
+
+from records import to_votes
+
+KEY_FIELDS = ['county', 'precinct', 'office', 'district', 'party', 'candidate']
+DEFAULT_PARTITIONS = 16
+
+
+def key_fields(old_headers, new_headers):
+    """Key columns present in both files, in KEY_FIELDS order."""
+    fields = [f for f in KEY_FIELDS if f in old_headers and f in new_headers]
+    if 'votes' not in old_headers or 'votes' not in new_headers:
+        raise ValueError('Both files need a votes column')
+    return fields
+
+def keyed_rows(reader, fields):
+    """Yields (key, votes) for each row of a csv.DictReader."""
+    for row in reader:
+        yield tuple(row[f] or '' for f in fields), to_votes(row['votes'])
+
+def change(kind, key, old_votes, new_votes):
+    delta = new_votes - old_votes if isinstance(old_votes, int) and isinstance(new_votes, int) else ''
+    return (kind,) + key + (old_votes, new_votes, delta)
+
+def diff_partition(old_rows, new_rows):
+    '''
+    Diffs two unordered row streams, holding only the old one in memory.
+    Repeated keys are paired up in file order.
+    '''
+    old = defaultdict(deque)
+    for key, votes in old_rows:
+        old[key].append(votes)
+    for key, votes in new_rows:
+        if old.get(key):
+            old_votes = old[key].popleft()
+            if old_votes != votes:
+                yield change('changed', key, old_votes, votes)
+        else:
+            yield change('added', key, '', votes)
+    for key, remaining in old.items():
+        for old_votes in remaining:
+            yield change('removed', key, old_votes, '')
+
+def sorted_rows(rows, label):
+    last = None
+    for key, votes in rows:
+        if last is not None and key < last:
+            raise ValueError(f'{label} is not sorted by its key columns at {key}')
+        last = key
+        yield key, votes
+
+def diff_sorted(old_rows, new_rows):
+    '''
+    Merge-joins two row streams already sorted by key, in constant memory.
+    '''
+    old_rows = sorted_rows(old_rows, 'old file')
+    new_rows = sorted_rows(new_rows, 'new file')
+    old = next(old_rows, None)
+    new = next(new_rows, None)
+    while old is not None or new is not None:
+        if new is None or (old is not None and old[0] < new[0]):
+            yield change('removed', old[0], old[1], '')
+            old = next(old_rows, None)
+        elif old is None or new[0] < old[0]:
+            yield change('added', new[0], '', new[1])
+            new = next(new_rows, None)
+        else:
+            if old[1] != new[1]:
+                yield change('changed', old[0], old[1], new[1])
+            old = next(old_rows, None)
+            new = next(new_rows, None)
+
+def partition(rows, directory, name, partitions):
+    '''
+    Spreads rows over partition files by a stable hash of the key.
+    Returns the file names, one per partition.
+    '''
+    fnames = [os.path.join(directory, f'{name}-{i}.csv') for i in range(partitions)]
+    files = [open(f, 'w') for f in fnames]
+    try:
+        writers = [csv.writer(f) for f in files]
+        for key, votes in rows:
+            writers[zlib.crc32('\x1f'.join(key).encode('utf-8')) % partitions].writerow(key + (votes,))
+    finally:
+        for f in files:
+            f.close()
+    return fnames
+
+def read_partition(fname):
+    with open(fname, 'r') as f:
+        for row in csv.reader(f):
+            yield tuple(row[:-1]), to_votes(row[-1])
+
+def diff_hashed(old_rows, new_rows, partitions=DEFAULT_PARTITIONS):
+    with tempfile.TemporaryDirectory() as directory:
+        old_parts = partition(old_rows, directory, 'old', partitions)
+        new_parts = partition(new_rows, directory, 'new', partitions)
+        for old_part, new_part in zip(old_parts, new_parts):
+            yield from diff_partition(read_partition(old_part), read_partition(new_part))
+
+def diff_files(old_file, new_file, output, partitions=DEFAULT_PARTITIONS, presorted=False):
+    '''
+    Writes the changes between two results files to the output file object.
+    Returns counts of added, removed and changed rows.
+    '''
+    counts = {'added': 0, 'removed': 0, 'changed': 0}
+    with open(old_file, 'r') as old_csv, open(new_file, 'r') as new_csv:
+        old_reader = csv.DictReader(old_csv)
+        new_reader = csv.DictReader(new_csv)
+        fields = key_fields(old_reader.fieldnames, new_reader.fieldnames)
+        old_rows = keyed_rows(old_reader, fields)
+        new_rows = keyed_rows(new_reader, fields)
+        if presorted:
+            changes = diff_sorted(old_rows, new_rows)
+        else:
+            changes = diff_hashed(old_rows, new_rows, partitions)
+
+        w = csv.writer(output)
+        w.writerow(['change'] + fields + ['old_votes', 'new_votes', 'delta'])
+        for row in changes:
+            counts[row[0]] += 1
+            w.writerow(row)
+    return counts
+
+
+@click.command()
+@click.argument('old_file', type=click.Path(exists=True))
+@click.argument('new_file', type=click.Path(exists=True))
+@click.option('--output', '-o', default='-', type=click.Path(), help='Output csv for the changes, stdout by default')
+@click.option('--partitions', default=DEFAULT_PARTITIONS, help='Hash partitions; more means less memory per partition')
+@click.option('--sorted', 'presorted', is_flag=True, help='Inputs are already sorted by key, so merge them without partitioning')
+def diff(old_file, new_file, output, partitions, presorted):
+    """Lists rows added, removed or with changed votes between two snapshots of a results file."""
+    try:
+        if output == '-':
+            counts = diff_files(old_file, new_file, sys.stdout, partitions, presorted)
+        else:
+            # written beside the output and moved into place once complete, since
+            # --sorted only finds an unsorted input after some changes are written
+            partial = output + '.partial'
+            with open(partial, 'w') as f:
+                try:
+                    counts = diff_files(old_file, new_file, f, partitions, presorted)
+                except BaseException:
+                    f.close()
+                    os.remove(partial)
+                    raise
+            os.replace(partial, output)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f'{counts["added"]} added, {counts["removed"]} removed, {counts["changed"]} changed', err=True)
+
+if __name__ == '__main__':
+    diff()
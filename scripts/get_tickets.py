@@ -2,6 +2,7 @@ import os
 import glob
 import pandas as pd
 from tickets import Tickets
+from instrument import trace
 
 '''
 Navigates through available general precinct files 
@@ -35,8 +36,10 @@ def format_files(filenames):
     '''
     df_dict = {}
     for year, files in filenames.items():
-        dfs = [pd.read_csv(f) for f in files]
-        df = pd.concat(dfs)
+        with trace.stage('load', year=year):
+            dfs = [pd.read_csv(f) for f in files]
+            df = pd.concat(dfs)
+            trace.count('rows', len(df))
         df_dict[year] = df
         
     return df_dict
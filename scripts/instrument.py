@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+
+"""Opt-in stage timers, row counters and peak-memory sampling for the conversion scripts.
+
+Nothing is recorded unless it is switched on through the environment:
+
+    WV_TRACE=trace.json        write a JSON trace of every stage when the script exits
+    WV_PROFILE=profiles/       also run each stage under cProfile and dump <stage>-<n>.prof there
+    WV_PROFILE_STAGES=parse,match   only profile these stages
+
+    WV_TRACE=trace.json python get_tickets.py
+"""
+
+import os
+import sys
+import json
+import time
+import atexit
+import cProfile
+import threading
+
+from contextlib import contextmanager, nullcontext
+
+try:
+    import resource
+except ImportError:
+    # POSIX only; memory readings are 0 on Windows
+    resource = None
+
+SAMPLE_INTERVAL = 0.01
+
+
+def peak_rss_mb():
+    """Process peak resident set size, or 0 where the resource module is missing."""
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and KiB on Linux
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 1024
+
+def current_rss_mb():
+    """Resident set size right now, falling back to the process peak off Linux."""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError, IndexError):
+        return peak_rss_mb()
+
+
+class Trace():
+
+    def __init__(self, path=None, profile_dir=None, profile_stages=None):
+        self.path = None
+        self.stages = []
+        self.counters = {}
+        self._open = []
+        self._profiling = False
+        self._profile_counts = {}
+        self._sampler = None
+        if path:
+            self.enable(path, profile_dir, profile_stages)
+
+    @classmethod
+    def from_env(cls):
+        stages = os.environ.get('WV_PROFILE_STAGES')
+        return cls(os.environ.get('WV_TRACE'), os.environ.get('WV_PROFILE'), stages.split(',') if stages else None)
+
+    @property
+    def enabled(self):
+        return self.path is not None
+
+    def enable(self, path, profile_dir=None, profile_stages=None):
+        # absolute, since the scripts chdir into year folders as they go
+        self.path = os.path.abspath(path)
+        self.profile_dir = os.path.abspath(profile_dir) if profile_dir else None
+        self.profile_stages = profile_stages
+        self.started = time.time()
+        self._origin = time.perf_counter()
+        if self.profile_dir:
+            os.makedirs(self.profile_dir, exist_ok=True)
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._sampler.start()
+        atexit.register(self.write)
+
+    def _sample(self):
+        '''
+        Polls RSS so each open stage records its own peak,
+        not just the process-wide high water mark.
+        '''
+        while True:
+            rss = current_rss_mb()
+            for record in list(self._open):
+                if rss > record['peak_rss_mb']:
+                    record['peak_rss_mb'] = rss
+            time.sleep(SAMPLE_INTERVAL)
+
+    def stage(self, name, **meta):
+        '''
+        Context manager timing one stage. Extra keyword arguments
+        (a county, a year) are stored with the stage.
+        '''
+        if not self.enabled:
+            return nullcontext()
+        return self._stage(name, meta)
+
+    @contextmanager
+    def _stage(self, name, meta):
+        record = {'stage': name, 'rows': 0, 'peak_rss_mb': current_rss_mb()}
+        record.update(meta)
+        profiler = None
+        if self.profile_dir and not self._profiling and (not self.profile_stages or name in self.profile_stages):
+            # cProfile can't nest, so inner stages are part of the outer stage's profile
+            profiler = cProfile.Profile()
+            self._profiling = True
+        self._open.append(record)
+        started = time.perf_counter()
+        cpu_started = time.process_time()
+        if profiler:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler:
+                profiler.disable()
+                self._profiling = False
+                n = self._profile_counts.get(name, 0) + 1
+                self._profile_counts[name] = n
+                record['profile'] = os.path.join(self.profile_dir, f'{name}-{n}.prof')
+                profiler.dump_stats(record['profile'])
+            record['start'] = started - self._origin
+            record['wall_time'] = time.perf_counter() - started
+            record['cpu_time'] = time.process_time() - cpu_started
+            record['peak_rss_mb'] = max(record['peak_rss_mb'], current_rss_mb())
+            self._open.remove(record)
+            self.stages.append(record)
+
+    def count(self, name, n=1):
+        '''
+        Adds n to a named counter and to the rows of the innermost open stage.
+        '''
+        if not self.enabled:
+            return
+        self.counters[name] = self.counters.get(name, 0) + n
+        if self._open:
+            self._open[-1]['rows'] += n
+
+    def counted(self, rows, name='rows'):
+        '''
+        Wraps an iterable so each item is counted as it is consumed.
+        Returns rows untouched when tracing is off.
+        '''
+        if not self.enabled:
+            return rows
+        return self._counted(rows, name)
+
+    def _counted(self, rows, name):
+        # counted once the rows run out, to keep the per-row cost to an increment
+        n = 0
+        try:
+            for row in rows:
+                n += 1
+                yield row
+        finally:
+            self.count(name, n)
+
+    def as_dict(self):
+        return {
+            'script': os.path.basename(sys.argv[0]),
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+            'peak_rss_mb': peak_rss_mb(),
+            'counters': self.counters,
+            'stages': self.stages,
+        }
+
+    def write(self):
+        if not self.enabled:
+            return
+        with open(self.path, 'w') as f:
+            json.dump(self.as_dict(), f, indent=2)
+
+
+trace = Trace.from_env()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+
+"""Local stand-in for the Clarity results host, for end-to-end runs of watch_clarity.py.
+
+Serves the state's current_ver.txt, Web01/en/json/electionsettings.json and a
+reports/detailxml.zip per county and version. Votes in each county's detail.xml
+are derived from its version, so bumping a county changes its results, and
+MockElection.fail() makes the next requests for a file return a 503.
+
+    python mock_clarity.py --port 8001 --bump-every 30
+    python watch_clarity.py -u http://127.0.0.1:8001/results.enr.clarityelections.com/WV/115888/Web01/en/summary.html -f 20221108__wv__general -y /tmp/2022 --interval 10
+"""
+
+import io
+import json
+import time
+import zlib
+import random
+import zipfile
+import threading
+import click
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from xml.sax.saxutils import quoteattr
+
+HOSTNAME = 'results.enr.clarityelections.com'
+STATE_ID = 'WV'
+ELECTION_ID = '115888'
+COUNTIES = ['Kanawha', 'Boone', 'Putnam']
+PRECINCTS = ['PRECINCT 103', 'PRECINCT 103A', 'PRECINCT 105']
+VOTE_TYPES = ['Election Day', 'Absentee by Mail', 'Advance in Person', 'Provisional']
+# (title, [(choice, party)]) as they appear in the 2022 general detail.xml
+CONTESTS = [
+    ('U.S. HOUSE OF REPRESENTATIVES, 1st Congressional District', [('CAROL MILLER', 'REP'), ('LACY WATSON', 'DEM')]),
+    ('STATE SENATOR, 8th Senatorial District', [('MARK R. MAYNARD', 'REP'), ('DONNA J. BOLEY', 'DEM')]),
+    ('Amendment No. 2: Property Tax Modernization Amendment', [('FOR', None), ('AGAINST', None)]),
+]
+
+
+def precinct_votes(county, version, precinct, choice, vote_type):
+    """Stable per-precinct votes that grow with the county's version."""
+    key = '|'.join([county, precinct, choice, vote_type]).encode('utf-8')
+    return (zlib.crc32(key) % 50) * int(version)
+
+def detail_xml(county, version):
+    out = io.StringIO()
+    out.write("<?xml version='1.0' encoding='utf-8'?>\n<ElectionResult>")
+    out.write(f'<Timestamp>11/9/2022 1:00:00 AM EST</Timestamp><ElectionName>General Election</ElectionName>'
+              f'<ElectionDate>11/8/2022</ElectionDate><Region>{county}</Region>')
+    out.write('<VoterTurnout totalVoters="0" ballotsCast="0" voterTurnout="0"><Precincts>')
+    for precinct in PRECINCTS:
+        out.write(f'<Precinct name={quoteattr(precinct)} totalVoters="0" ballotsCast="0" voterTurnout="0" />')
+    out.write('</Precincts></VoterTurnout>')
+    for key, (title, choices) in enumerate(CONTESTS):
+        out.write(f'<Contest key="{key}" text={quoteattr(title)} voteFor="1" isQuestion="false">')
+        for choice_key, (choice, party) in enumerate(choices):
+            party_attr = f' party="{party}"' if party else ''
+            out.write(f'<Choice key="{choice_key}" text={quoteattr(choice)} totalVotes="0"{party_attr}>')
+            for vote_type in VOTE_TYPES:
+                votes = [precinct_votes(county, version, p, choice, vote_type) for p in PRECINCTS]
+                out.write(f'<VoteType name={quoteattr(vote_type)} votes="{sum(votes)}">')
+                for precinct, v in zip(PRECINCTS, votes):
+                    out.write(f'<Precinct name={quoteattr(precinct)} votes="{v}" />')
+                out.write('</VoteType>')
+            out.write('</Choice>')
+        out.write('</Contest>')
+    out.write('</ElectionResult>')
+    return out.getvalue()
+
+
+class MockElection():
+    '''
+    Versions of a statewide election and its counties. The state version
+    moves whenever any county is bumped, as it does on the real host.
+    '''
+
+    def __init__(self, counties=COUNTIES):
+        self.state_version = 1
+        self.versions = {county: 1 for county in counties}
+        self.election_ids = {county: str(300000 + i) for i, county in enumerate(counties)}
+        self.failures = {}
+        self.lock = threading.Lock()
+
+    def bump(self, county=None):
+        '''Publishes a new version of one county, a random one by default. Returns the county.'''
+        with self.lock:
+            county = county or random.choice(list(self.versions))
+            self.versions[county] += 1
+            self.state_version += 1
+            return county
+
+    def fail(self, name, times=1):
+        '''Answers the next requests for a file (current_ver.txt, electionsettings.json, detailxml.zip) with a 503.'''
+        with self.lock:
+            self.failures[name] = self.failures.get(name, 0) + times
+
+    def failing(self, name):
+        with self.lock:
+            if not self.failures.get(name):
+                return False
+            self.failures[name] -= 1
+            return True
+
+    def settings(self):
+        counties = [f'{county}|{self.election_ids[county]}|{version}|11/9/2022 1:00:00 AM EST|1'
+                    for county, version in self.versions.items()]
+        return {'settings': {'electiondetails': {'participatingcounties': counties}}}
+
+    def report(self, county, version):
+        '''Zipped detail.xml for a county at a published version, or None.'''
+        if county not in self.versions or not 1 <= int(version) <= self.versions[county]:
+            return None
+        content = io.BytesIO()
+        with zipfile.ZipFile(content, 'w', zipfile.ZIP_DEFLATED) as z:
+            z.writestr('detail.xml', detail_xml(county, version))
+        return content.getvalue()
+
+
+class MockClarityHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, body, content_type):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        election = self.server.election
+        parts = self.path.split('?')[0].strip('/').split('/')
+        # HOSTNAME/WV/115888/... for the state, HOSTNAME/WV/<county>/<id>/<version>/... for a county
+        if len(parts) < 4 or parts[0] != HOSTNAME or parts[1] != STATE_ID:
+            return self.send_error(404)
+        if election.failing(parts[-1]):
+            return self.send_error(503)
+        if parts[2] == ELECTION_ID:
+            path = '/'.join(parts[3:])
+            if path == 'current_ver.txt':
+                return self.send_body(str(election.state_version).encode('utf-8'), 'text/plain')
+            if path.endswith('json/electionsettings.json'):
+                return self.send_body(json.dumps(election.settings()).encode('utf-8'), 'application/json')
+        elif len(parts) == 7 and parts[5:] == ['reports', 'detailxml.zip']:
+            body = election.report(parts[2], parts[4])
+            if body is not None:
+                return self.send_body(body, 'application/zip')
+        self.send_error(404)
+
+
+def start_server(election, host='127.0.0.1', port=0):
+    '''
+    Serves election from a background thread.
+    Returns the server and the state summary url to point clarify at.
+    '''
+    server = ThreadingHTTPServer((host, port), MockClarityHandler)
+    server.election = election
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, f'http://{host}:{port}/{HOSTNAME}/{STATE_ID}/{ELECTION_ID}/Web01/en/summary.html'
+
+
+@click.command()
+@click.option('--host', default='127.0.0.1', help='Interface to listen on')
+@click.option('--port', '-p', default=8001, help='Port to listen on')
+@click.option('--bump-every', type=float, default=None, help='Seconds between new versions of a random county')
+def serve(host, port, bump_every):
+    """Serves a mock Clarity election whose county results change over time."""
+    election = MockElection()
+    server, url = start_server(election, host, port)
+    click.echo(f'Serving {url}')
+    while True:
+        time.sleep(bump_every or 3600)
+        if bump_every:
+            county = election.bump()
+            click.echo(f'{county} is now at version {election.versions[county]}')
+
+if __name__ == '__main__':
+    serve()
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+
+"""Local HTTP/JSON query service over the consolidated precinct files.
+
+Each file is loaded once into an index keyed by office, district and county,
+with county and statewide rollups computed up front. Files are reloaded when
+their modification time changes.
+
+    python query_server.py --port 8000
+
+    GET /elections
+    GET /offices?election=20201103__wv__general
+    GET /results?election=20201103__wv__general&office=PRESIDENT&level=county
+    GET /results?election=20221108__wv__general&office=U.S. HOUSE OF REPRESENTATIVES&county=Kanawha&level=precinct
+
+Matching on office, district, county, candidate and party ignores case and
+surrounding whitespace. level is precinct, county (default) or state.
+"""
+
+import os
+import re
+import csv
+import glob
+import json
+import time
+import threading
+import click
+
+from collections import defaultdict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+from records import record_from_row
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_PATTERN = os.path.join(ROOT_DIR, '*', '*__precinct.csv')
+# statewide files only, e.g. 20201103__wv__general__precinct.csv but not ...__kanawha__precinct.csv
+CONSOLIDATED_REGEX = re.compile(r'^(\d{8}__wv__[a-z]+)__precinct\.csv$')
+LEVELS = ['precinct', 'county', 'state']
+# county subtotal rows some files carry alongside their precincts, e.g. Raleigh,TOTAL in 2018
+SUBTOTAL_PRECINCTS = {'total', 'totals'}
+
+
+def normalize(value):
+    return (value or '').strip().casefold()
+
+def nested():
+    return defaultdict(nested)
+
+
+class ElectionIndex():
+    '''
+    Records from one consolidated file, indexed as
+    office -> district -> county -> records, plus county and state rollups
+    of votes per (candidate, party). Subtotal rows stay in the precinct
+    index but are left out of the rollups so they aren't counted twice.
+    '''
+
+    def __init__(self, election, fname):
+        self.election = election
+        self.fname = fname
+        self.mtime = os.path.getmtime(fname)
+        self.loaded_at = time.strftime('%Y-%m-%dT%H:%M:%S')
+        self.rows = 0
+        self.precincts = nested()
+        self.counties = nested()
+        self.state = nested()
+        with open(fname, 'r') as csvfile:
+            for row in csv.DictReader(csvfile):
+                self.add(record_from_row(row))
+        self.precincts = self.freeze(self.precincts)
+        self.counties = self.freeze(self.counties)
+        self.state = self.freeze(self.state)
+
+    @classmethod
+    def freeze(cls, tree):
+        '''
+        Turns the nested defaultdicts into plain dicts so lookups
+        of missing keys don't grow the index.
+        '''
+        if isinstance(tree, defaultdict):
+            return {k: cls.freeze(v) for k, v in tree.items()}
+        return tree
+
+    def add(self, record):
+        self.rows += 1
+        office, district, county = normalize(record.office), normalize(record.district), normalize(record.county)
+        precincts = self.precincts[office][district]
+        if county not in precincts:
+            precincts[county] = []
+        precincts[county].append(record)
+        if not isinstance(record.votes, int) or normalize(record.precinct) in SUBTOTAL_PRECINCTS:
+            return
+        choice = (record.candidate, record.party)
+        counties = self.counties[office][district]
+        if county not in counties:
+            counties[county] = {'county': record.county, 'office': record.office, 'district': record.district, 'votes': defaultdict(int)}
+        counties[county]['votes'][choice] += record.votes
+        state = self.state[office]
+        if district not in state:
+            state[district] = {'office': record.office, 'district': record.district, 'votes': defaultdict(int)}
+        state[district]['votes'][choice] += record.votes
+
+    def offices(self):
+        return [{'office': d['office'], 'district': d['district']} for districts in self.state.values() for d in districts.values()]
+
+    @classmethod
+    def branches(cls, tree, key):
+        '''Yields the subtrees matching key, or every subtree when key is None.'''
+        if key is None:
+            yield from tree.values()
+        elif normalize(key) in tree:
+            yield tree[normalize(key)]
+
+    def query(self, level='county', office=None, district=None, county=None, candidate=None, party=None):
+        candidate = normalize(candidate) if candidate is not None else None
+        party = normalize(party) if party is not None else None
+        wanted = lambda c, p: (candidate is None or normalize(c) == candidate) and (party is None or normalize(p) == party)
+
+        results = []
+        if level == 'precinct':
+            for districts in self.branches(self.precincts, office):
+                for counties in self.branches(districts, district):
+                    for records in self.branches(counties, county):
+                        for r in records:
+                            if wanted(r.candidate, r.party):
+                                results.append({'county': r.county, 'precinct': r.precinct, 'office': r.office, 'district': r.district,
+                                                'party': r.party, 'candidate': r.candidate, 'votes': r.votes})
+        elif level == 'county':
+            for districts in self.branches(self.counties, office):
+                for counties in self.branches(districts, district):
+                    for total in self.branches(counties, county):
+                        for (c, p), votes in total['votes'].items():
+                            if wanted(c, p):
+                                results.append({'county': total['county'], 'office': total['office'], 'district': total['district'],
+                                                'party': p, 'candidate': c, 'votes': votes})
+        else:
+            for districts in self.branches(self.state, office):
+                for total in self.branches(districts, district):
+                    for (c, p), votes in total['votes'].items():
+                        if wanted(c, p):
+                            results.append({'office': total['office'], 'district': total['district'], 'party': p, 'candidate': c, 'votes': votes})
+        return results
+
+
+class ResultStore():
+    '''
+    Holds an ElectionIndex per consolidated file and swaps in a fresh one
+    whenever a file changes on disk.
+    '''
+
+    def __init__(self, pattern=DEFAULT_PATTERN):
+        self.pattern = pattern
+        self.elections = {}
+        self.lock = threading.Lock()
+        self.refresh()
+
+    def files(self):
+        found = {}
+        for fname in glob.glob(self.pattern):
+            m = CONSOLIDATED_REGEX.match(os.path.basename(fname))
+            if m:
+                found[m.group(1)] = fname
+        return found
+
+    def refresh(self):
+        '''Loads new or modified files and drops removed ones. Returns the elections reloaded.'''
+        with self.lock:
+            reloaded = []
+            found = self.files()
+            elections = dict(self.elections)
+            for election, fname in found.items():
+                current = elections.get(election)
+                try:
+                    if current is None or current.fname != fname or os.path.getmtime(fname) != current.mtime:
+                        elections[election] = ElectionIndex(election, fname)
+                        reloaded.append(election)
+                except (OSError, csv.Error) as e:
+                    # the file is being rewritten; keep serving the old index until the next check
+                    print(f'{fname}: {e}')
+            for election in set(elections) - set(found):
+                del elections[election]
+            # replaced in one assignment so requests never see a partial reload
+            self.elections = elections
+            return reloaded
+
+    def watch(self, interval):
+        while True:
+            time.sleep(interval)
+            for election in self.refresh():
+                print(f'Reloaded {election}')
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+
+    store = None
+
+    def send_json(self, body, status=200):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def election(self, params):
+        name = params.get('election')
+        elections = self.store.elections
+        if name is None and len(elections) == 1:
+            return next(iter(elections.values()))
+        if name not in elections:
+            raise LookupError(f'Unknown election {name}. Choose from: {", ".join(sorted(elections))}')
+        return elections[name]
+
+    def do_GET(self):
+        started = time.perf_counter()
+        url = urlsplit(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        try:
+            if url.path == '/elections':
+                body = [{'election': e.election, 'file': os.path.basename(e.fname), 'rows': e.rows, 'loaded_at': e.loaded_at}
+                        for e in sorted(self.store.elections.values(), key=lambda e: e.election)]
+            elif url.path == '/offices':
+                body = self.election(params).offices()
+            elif url.path == '/results':
+                level = params.get('level', 'county')
+                if level not in LEVELS:
+                    raise ValueError(f'level must be one of {", ".join(LEVELS)}')
+                if level == 'state' and 'county' in params:
+                    raise ValueError('county cannot be used with level=state')
+                index = self.election(params)
+                results = index.query(level, params.get('office'), params.get('district'), params.get('county'),
+                                      params.get('candidate'), params.get('party'))
+                body = {'election': index.election, 'level': level, 'count': len(results), 'results': results}
+            else:
+                return self.send_json({'error': f'Unknown path {url.path}'}, 404)
+        except LookupError as e:
+            return self.send_json({'error': str(e)}, 404)
+        except ValueError as e:
+            return self.send_json({'error': str(e)}, 400)
+        if isinstance(body, dict):
+            body['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 3)
+        self.send_json(body)
+
+
+@click.command()
+@click.option('--host', default='127.0.0.1', help='Interface to listen on')
+@click.option('--port', '-p', default=8000, help='Port to listen on')
+@click.option('--pattern', default=DEFAULT_PATTERN, help='Glob for consolidated precinct files')
+@click.option('--reload-interval', default=2.0, help='Seconds between checks for changed files')
+def serve(host, port, pattern, reload_interval):
+    """Serves county, precinct and statewide totals from the consolidated precinct files."""
+    store = ResultStore(pattern)
+    for e in store.elections.values():
+        click.echo(f'Loaded {e.election}: {e.rows} rows')
+    threading.Thread(target=store.watch, args=(reload_interval,), daemon=True).start()
+    QueryHandler.store = store
+    server = ThreadingHTTPServer((host, port), QueryHandler)
+    click.echo(f'Listening on http://{host}:{port}')
+    server.serve_forever()
+
+if __name__ == '__main__':
+    serve()
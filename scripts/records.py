@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+
+"""Compact row type shared by the precinct result converters.
+
+County, precinct, office, district, party and candidate values repeat
+hundreds of thousands of times in a statewide file, so they are interned
+and rows are stored as tuples with integer votes instead of dicts or lists
+of fresh strings.
+"""
+
+import re
+import sys
+
+from collections import namedtuple
+from operator import attrgetter
+
+PRECINCT_FIELDS = ['county', 'precinct', 'office', 'district', 'party', 'candidate', 'votes']
+
+# breakdown holds per-vote-type counts, aligned with a separate list of vote types
+PrecinctRecord = namedtuple('PrecinctRecord', PRECINCT_FIELDS + ['breakdown'], defaults=((),))
+
+# only counts that round-trip unchanged through int(), so rewritten files stay byte-identical
+VOTES_REGEX = re.compile(r'(0|[1-9][0-9]*)\Z')
+
+
+def intern_value(value):
+    if value is None:
+        return None
+    return sys.intern(str(value))
+
+def to_votes(votes):
+    """Converts a vote count to int, leaving blanks and other placeholders untouched."""
+    if isinstance(votes, str) and VOTES_REGEX.match(votes):
+        return int(votes)
+    return votes
+
+def make_record(county, precinct, office, district, party, candidate, votes, breakdown=()):
+    return PrecinctRecord(intern_value(county), intern_value(precinct), intern_value(office), intern_value(district),
+                          intern_value(party), intern_value(candidate), to_votes(votes), tuple(breakdown))
+
+def record_from_row(row):
+    """Builds a record from a csv.DictReader row."""
+    return make_record(row['county'], row['precinct'], row['office'], row['district'], row['party'], row['candidate'], row['votes'])
+
+def row_getter(fields=PRECINCT_FIELDS):
+    """Returns a callable turning a record into a csv row with the given column order."""
+    return attrgetter(*fields)
@@ -13,6 +13,7 @@ pd.set_option('mode.chained_assignment',None)
 import numpy as np
 from fuzzywuzzy import fuzz, process
 from curtsies.fmtfuncs import red, bold, green, on_blue, yellow
+from instrument import trace
 
 class Tickets():
     
@@ -91,26 +92,30 @@ class Tickets():
         c = df['candidate']
         o = df['office']
         
-        print('CLEANING CANDIDATES ...')
-        print('starting uniques:', red(str(len(c.unique()))))
-        c = self.clean_names(c)
-        c = self.tags(c)
-        print('final uniques:', green(str(len(c.unique()))))
-        
-        print('CLEANING OFFICES ...')
-        print('starting uniques:', red(str(len(o.unique()))))
-        o = self.clean_offices(o)
-        print('final uniques:', green(str(len(o.unique()))))
-        
-        df['candidate'] = c
-        df['office'] = o
+        with trace.stage('clean', year=self.year):
+            trace.count('cleaned', len(df))
+            print('CLEANING CANDIDATES ...')
+            print('starting uniques:', red(str(len(c.unique()))))
+            c = self.clean_names(c)
+            c = self.tags(c)
+            print('final uniques:', green(str(len(c.unique()))))
+            
+            print('CLEANING OFFICES ...')
+            print('starting uniques:', red(str(len(o.unique()))))
+            o = self.clean_offices(o)
+            print('final uniques:', green(str(len(o.unique()))))
+            
+            df['candidate'] = c
+            df['office'] = o
         
         # matching until clean, tracking iterations
         print('------------------------------')
         changes_list = []
         i = 1
         while True:
-            df, changes, done = self.match(df, i)
+            with trace.stage('match', year=self.year, iteration=i):
+                df, changes, done = self.match(df, i)
+                trace.count('changes', len(changes))
             changes_list.append(changes)
             if done:
                 break
@@ -119,21 +124,23 @@ class Tickets():
         print('------------------------------')
         
         # assembling tickets
-        offices = df.office.drop_duplicates().tolist()
-        dt = []
-        for o in offices:
-            odf = df.groupby('office').get_group(o)
-            candidates = odf.candidate.drop_duplicates().dropna().tolist()
-            for c in candidates:
-                d = odf.district[odf.candidate == c].unique()[0]
-                p = odf.party[odf.candidate == c].unique()[0]
-                dt.append((o,d,c,p))
-        fdf = pd.DataFrame(dt, columns=['office','district','candidate','party'])
-    
-        # compiling changes
-        change_df = pd.concat([pd.DataFrame(c, columns=['old', 'new', 'office']) for c in changes_list], 
-                              keys=list(range(i)))
-        change_df.index.names = ['iteration','ind']
+        with trace.stage('assemble', year=self.year):
+            offices = df.office.drop_duplicates().tolist()
+            dt = []
+            for o in offices:
+                odf = df.groupby('office').get_group(o)
+                candidates = odf.candidate.drop_duplicates().dropna().tolist()
+                for c in candidates:
+                    d = odf.district[odf.candidate == c].unique()[0]
+                    p = odf.party[odf.candidate == c].unique()[0]
+                    dt.append((o,d,c,p))
+            fdf = pd.DataFrame(dt, columns=['office','district','candidate','party'])
+            trace.count('tickets', len(fdf))
+        
+            # compiling changes
+            change_df = pd.concat([pd.DataFrame(c, columns=['old', 'new', 'office']) for c in changes_list], 
+                                  keys=list(range(i)))
+            change_df.index.names = ['iteration','ind']
         
         return fdf, change_df
 
@@ -280,8 +287,9 @@ class Tickets():
         Saves data to file as CSVs.
         '''
         filename = f'{self.year}/{self.state}__{self.year}__tickets.csv'
-        df.to_csv(filename)
-        change_df.to_csv(f'{self.year}/{self.state}__{self.year}__ticket__changes.csv')
+        with trace.stage('save', year=self.year):
+            df.to_csv(filename)
+            change_df.to_csv(f'{self.year}/{self.state}__{self.year}__ticket__changes.csv')
         
         print(f'Finished and saved to file at {filename}')
     
\ No newline at end of file
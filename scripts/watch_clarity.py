@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+
+"""Election-night watcher for Clarity results.
+
+Polls the state jurisdiction's current version on an interval, re-processes
+only the counties whose version changed and rebuilds the statewide precinct
+file. Each cycle prints (and optionally appends to a file) a JSON line with
+fetch/parse/write/consolidate latencies.
+
+clarify accepts any url containing a Clarity hostname, so the watcher can be
+pointed at a local mock server for end-to-end runs, e.g.
+http://127.0.0.1:8000/results.enr.clarityelections.com/WV/115888/Web01/en/summary.html
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+import click
+import clarify
+import requests
+
+from contextlib import contextmanager
+
+import clarity_parser
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+import statewide_generator
+
+
+@contextmanager
+def working_dir(path):
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+class ClarityWatcher():
+
+    STAGES = ['fetch', 'parse', 'write', 'consolidate']
+
+    def __init__(self, url, filename, year, interval=60, jitter=0.2, vote_type_columns=False):
+        self.url = url
+        self.filename = filename
+        self.year = year
+        self.vote_type_columns = vote_type_columns
+        self.interval = interval
+        self.jitter = jitter
+        self.state_version = None
+        self.county_versions = {}
+        self.metrics = []
+
+    def next_delay(self):
+        '''
+        Polling interval spread by +/- jitter so several watchers
+        don't hit the results host in lockstep.
+        '''
+        return self.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def changed_counties(self):
+        '''
+        Returns the subjurisdictions whose version differs from the last
+        one processed, or an empty list when the state version hasn't moved.
+        The list is None when the poll failed.
+        '''
+        version = clarify.Jurisdiction.get_current_ver(self.url)
+        if version is None:
+            return version, None
+        if version == self.state_version:
+            return version, []
+        j = clarify.Jurisdiction(url=self.url, level="state")
+        # clarify returns no counties rather than raising when electionsettings.json can't be fetched
+        listed = j.get_subjurisdictions()
+        if not listed:
+            return version, None
+        subs = [sub for sub in listed if self.county_versions.get(sub.name) != sub.current_ver]
+        return version, subs
+
+    def run_cycle(self):
+        '''
+        Polls once, refreshes changed counties and rebuilds the statewide file.
+        Returns the cycle metrics.
+        '''
+        started = time.perf_counter()
+        timings = dict.fromkeys(self.STAGES, 0.0)
+        poll_error = None
+        try:
+            version, subs = self.changed_counties()
+        except requests.RequestException as e:
+            # a network blip shouldn't end the watch; the next poll tries again
+            print(f'Poll failed: {e}')
+            version, subs, poll_error = None, None, str(e)
+        poll_failed = subs is None
+        timings['fetch'] += time.perf_counter() - started
+
+        counties_dir = os.path.join(ROOT_DIR, self.year, 'counties')
+        refreshed = []
+        failed = []
+        # reports are extracted outside the counties folder so no detail.xml is left among the checked-in files
+        with tempfile.TemporaryDirectory() as report_dir, working_dir(counties_dir):
+            for sub in subs or []:
+                try:
+                    t = time.perf_counter()
+                    clarity_parser.fetch_county_report(sub, report_dir)
+                    timings['fetch'] += time.perf_counter() - t
+
+                    t = time.perf_counter()
+                    results, vote_types = clarity_parser.parse_precinct_results(xml_file=os.path.join(report_dir, 'detail.xml'))
+                    # built here so the parse latency covers grouping results into records, as the build stage does when tracing
+                    results = list(results)
+                    timings['parse'] += time.perf_counter() - t
+
+                    t = time.perf_counter()
+                    clarity_parser.write_precinct_results(clarity_parser.county_file_name(sub), self.filename, results, vote_types, self.vote_type_columns)
+                    timings['write'] += time.perf_counter() - t
+                except Exception as e:
+                    # leave the old version in place so the county is retried next cycle
+                    print(f'{sub.name}: {e}')
+                    failed.append(sub.name)
+                    continue
+                self.county_versions[sub.name] = sub.current_ver
+                refreshed.append(sub.name)
+
+        if refreshed:
+            t = time.perf_counter()
+            with working_dir(ROOT_DIR):
+                statewide_generator.generate_consolidated_file(self.year, self.filename + '__*__precinct.csv', os.path.join(self.year, self.filename + '__precinct.csv'))
+            timings['consolidate'] += time.perf_counter() - t
+        if not failed and not poll_failed:
+            self.state_version = version
+
+        metrics = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'version': version,
+            'poll_failed': poll_failed,
+            'poll_error': poll_error,
+            'refreshed': refreshed,
+            'failed': failed,
+            'total': time.perf_counter() - started,
+        }
+        metrics.update(timings)
+        self.metrics.append(metrics)
+        return metrics
+
+    def watch(self, max_cycles=None, metrics_file=None):
+        cycles = 0
+        while max_cycles is None or cycles < max_cycles:
+            metrics = self.run_cycle()
+            line = json.dumps(metrics)
+            print(line)
+            if metrics_file:
+                with open(metrics_file, 'a') as f:
+                    f.write(line + '\n')
+            cycles += 1
+            if max_cycles is None or cycles < max_cycles:
+                time.sleep(self.next_delay())
+
+
+@click.command()
+@click.option('--url', '-u', required=True, help='Clarity url for the statewide election')
+@click.option('--filename', '-f', required=True, help='Output filename prefix, e.g. 20221108__wv__general')
+@click.option('--year', '-y', required=True, help='Year directory holding the counties folder')
+@click.option('--interval', default=60.0, help='Seconds between polls')
+@click.option('--jitter', default=0.2, type=click.FloatRange(0, 1), help='Fraction of the interval to randomly add or subtract')
+@click.option('--max-cycles', type=int, default=None, help='Stop after this many polls')
+@click.option('--vote-type-columns', is_flag=True, help='Add a column per vote type to county files')
+@click.option('--metrics-file', type=click.Path(), default=None, help='Append cycle metrics as JSON lines')
+def watch(url, filename, year, interval, jitter, max_cycles, vote_type_columns, metrics_file):
+    """Polls a Clarity election and refreshes county and statewide precinct files as results change."""
+    watcher = ClarityWatcher(url, filename, year, interval=interval, jitter=jitter, vote_type_columns=vote_type_columns)
+    watcher.watch(max_cycles=max_cycles, metrics_file=metrics_file)
+
+if __name__ == '__main__':
+    watch()
@@ -2,6 +2,13 @@ import os
 import glob
 import csv
 
+try:
+    from instrument import trace
+    from records import record_from_row, row_getter
+except ImportError:
+    from scripts.instrument import trace
+    from scripts.records import record_from_row, row_getter
+
 year = '2022'
 election = '20221108'
 path = election+'*precinct.csv'
@@ -39,14 +46,14 @@ def generate_consolidated_file(year, path, output_file):
     os.chdir(year)
     os.chdir('counties')
     for fname in glob.glob(path):
-        with open(fname, "r") as csvfile:
+        with trace.stage('read', file=fname), open(fname, "r") as csvfile:
             print(fname)
             reader = csv.DictReader(csvfile)
-            for row in reader:
-                results.append([row['county'], row['precinct'], row['office'], row['district'], row['candidate'], row['party'], row['votes']])
+            for row in trace.counted(reader):
+                results.append(record_from_row(row))
     os.chdir('..')
     os.chdir('..')
-    with open(output_file, "w") as csv_outfile:
+    with trace.stage('write', file=output_file), open(output_file, "w") as csv_outfile:
         outfile = csv.writer(csv_outfile)
         outfile.writerow(['county','precinct', 'office', 'district', 'candidate', 'party', 'votes', 'vtd'])
-        outfile.writerows(results)
+        outfile.writerows(map(row_getter(['county','precinct', 'office', 'district', 'candidate', 'party', 'votes']), trace.counted(results)))